@@ -1,11 +1,22 @@
+import asyncio
+import io
 import os
-import random 
+import threading
+import numpy as np
 import pandas as pd
 import streamlit as st
+from urllib.parse import quote
 from sqlalchemy import create_engine, text, event
 from sqlalchemy.engine import URL
+from sqlalchemy.ext.asyncio import create_async_engine
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 
+try:
+    import connectorx as cx  # optional: zero-copy Arrow reads from postgres
+except ImportError:
+    cx = None
+
 # --------------- Page & env ---------------
 st.set_page_config(page_title="PTMsToPathways DB Viewer", page_icon="👻", layout="wide")
 load_dotenv()
@@ -36,6 +47,12 @@ def make_url() -> URL:
         },
     )
 
+# Same credentials as make_url, but in the plain URL form connectorx expects.
+CX_URL = (
+    f"postgresql://{quote(PGUSER or '')}:{quote(PGPASSWORD or '')}"
+    f"@{PGHOST}:{PGPORT}/{PGDATABASE}?sslmode={PGSSLMODE}"
+)
+
 @st.cache_resource
 def get_engine():
     engine = create_engine(
@@ -45,6 +62,9 @@ def get_engine():
         max_overflow=0,
         pool_timeout=5,
         pool_recycle=1800,
+        # psycopg2 executemany is one round-trip per row by default; this
+        # rewrites INSERTs as VALUES pages and batches the rest
+        executemany_mode="values_plus_batch",
     )
 
     # Apply per-connection settings after the pool hands out a DBAPI conn.
@@ -59,24 +79,171 @@ def get_engine():
 
 engine = get_engine()
 
-def fetch_df(sql: str, params: dict | None = None) -> pd.DataFrame:
+@st.cache_resource
+def get_async_engine():
+    # asyncpg twin of the main engine, used to overlap independent SELECTs
+    url = URL.create(
+        "postgresql+asyncpg",
+        username=PGUSER,
+        password=PGPASSWORD,
+        host=PGHOST,
+        port=int(PGPORT),
+        database=PGDATABASE,
+    )
+    return create_async_engine(
+        url,
+        pool_pre_ping=True,
+        pool_size=5,
+        max_overflow=0,
+        connect_args={"ssl": PGSSLMODE != "disable"},  # asyncpg wants 'ssl', not 'sslmode'
+    )
+
+async_engine = get_async_engine()
+
+@st.cache_resource
+def get_async_loop():
+    # asyncpg connections are bound to the event loop that created them, so
+    # all async work runs on this one long-lived loop in a daemon thread and
+    # the engine's pooled connections stay usable across reruns
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+async_loop = get_async_loop()
+
+async def afetch(sql: str, params: dict | None = None) -> pd.DataFrame:
+    async with async_engine.connect() as conn:
+        res = await conn.execute(text(sql), params or {})
+        return pd.DataFrame(res.mappings().all())
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_fetch_many(queries_key: tuple) -> list[pd.DataFrame]:
+    # Issue independent SELECTs at the same time: the page is bound by Neon
+    # round-trip latency, not CPU, so overlapping them stacks the waits
+    async def _gather():
+        return await asyncio.gather(*(afetch(s, dict(p)) for s, p in queries_key))
+    try:
+        return list(asyncio.run_coroutine_threadsafe(_gather(), async_loop).result())
+    except Exception as e:
+        st.error(f"DB error: {e}")
+        return [pd.DataFrame() for _ in queries_key]
+
+def fetch_many(queries: list[tuple[str, dict | None]]) -> list[pd.DataFrame]:
+    queries_key = tuple((s, tuple(sorted((p or {}).items()))) for s, p in queries)
+    return _cached_fetch_many(queries_key)
+
+# Cache read results so widget-driven reruns replay frames from RAM instead
+# of hitting Neon again; writes call _invalidate_reads() to invalidate.
+def _render_sql(sql: str, params: dict) -> str:
+    # connectorx doesn't take bind params, so inline them via sqlalchemy
+    return str(text(sql).bindparams(**params).compile(compile_kwargs={'literal_binds': True}))
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_fetch(sql: str, params_key: tuple) -> pd.DataFrame:
+    if cx is not None:
+        try:
+            return cx.read_sql(CX_URL, _render_sql(sql, dict(params_key)),
+                               return_type="pandas", protocol="binary")
+        except Exception:
+            pass  # fall back to the pandas path below
     try:
         with engine.connect() as conn:
-            return pd.read_sql(text(sql), conn, params=params or {})
+            return pd.read_sql(text(sql), conn, params=dict(params_key))
     except Exception as e:
         st.error(f"DB error: {e}")
         return pd.DataFrame()
-    
+
+def fetch_df(sql: str, params: dict | None = None) -> pd.DataFrame:
+    params_key = tuple(sorted((params or {}).items()))
+    return _cached_fetch(sql, params_key)
+
+def _invalidate_reads():
+    # Every write path funnels through here so both cached read layers
+    # (single fetches and batched fetch_many) refetch fresh data
+    _cached_fetch.clear()
+    _cached_fetch_many.clear()
+
+def stream_df(sql: str, batch: int = 50_000):
+    # Chunked Arrow reads keep peak memory flat as the matrix grows N^2;
+    # rendering can stop after the first batch instead of fetching everything
+    if cx is not None:
+        try:
+            reader = cx.read_sql(CX_URL, sql, return_type='arrow_stream', batch_size=batch)
+        except Exception:
+            reader = None  # fall back to the pandas path below
+        if reader is not None:
+            for b in reader:
+                yield b.to_pandas()
+            return
+    yield fetch_df(sql)  # no (working) connectorx: one cached fetch, same interface
+
+@st.cache_data(show_spinner=False)
+def make_choices(df: pd.DataFrame, col: str) -> dict[str, str]:
+    # Vectorized label build for the select boxes; st.cache_data hashes the
+    # frame contents, so reruns with unchanged data skip this entirely
+    vals = df[col].astype(str).tolist()
+    return dict(zip(vals, vals))
+
+def bulk_replace(df: pd.DataFrame, table: str, cols: list[str]):
+    # Rebuild a table from a data frame with COPY instead of to_sql's
+    # row-by-row INSERTs: one CSV stream over the wire instead of N statements
+    def _sql_type(dtype):
+        if dtype.kind == 'f':
+            # float32 frames land as REAL so the narrower storage sticks
+            return 'REAL' if dtype.itemsize == 4 else 'DOUBLE PRECISION'
+        return 'BIGINT' if dtype.kind == 'i' else 'TEXT'
+
+    col_defs = ', '.join(f'{c} {_sql_type(df[c].dtype)}' for c in cols)
+
+    buf = io.StringIO()
+    df[cols].to_csv(buf, index=False, header=False)
+    buf.seek(0)
+
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cur:
+            # TRUNCATE instead of DROP/CREATE when the table already exists:
+            # the correlation matview depends on ptmdataset, and DROP would
+            # fail with DependentObjectsStillExist
+            cur.execute('SELECT to_regclass(%s) IS NOT NULL', (table,))
+            if cur.fetchone()[0]:
+                cur.execute(f'TRUNCATE TABLE {table}')
+            else:
+                cur.execute(f'CREATE TABLE {table} ({col_defs})')
+            cur.copy_expert(f'COPY {table}({", ".join(cols)}) FROM STDIN WITH (FORMAT CSV)', buf)
+        raw.commit()
+    finally:
+        raw.close()
+    _invalidate_reads()
+
 # SQL functions
+def _insert_names_bulk(table: str, col: str, names: list[str]):
+    # One execute_values round-trip no matter how many names come in,
+    # instead of psycopg2's per-row executemany behavior
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cur:
+            rows = execute_values(
+                cur,
+                f"INSERT INTO {table}({col}) VALUES %s ON CONFLICT DO NOTHING RETURNING {col}",
+                [(n,) for n in names],
+                page_size=1000,
+                fetch=True,
+            )
+        raw.commit()
+    finally:
+        raw.close()
+    if rows:
+        _invalidate_reads()
+        st.session_state['inputs_changed'] = True
+    return [{col: r[0]} for r in rows]
+
+def insert_ptms_bulk(names: list[str]):
+    return _insert_names_bulk('ptms', 'ptm', names)
+
 def insert_ptm(ptm: str):
-    sql = '''
-        INSERT INTO ptms(ptm)
-        VALUES (:n)
-        RETURNING ptm AS ptm
-    '''
-    with engine.begin() as conn:
-        df = pd.read_sql(text(sql), conn, params={"n": ptm})
-    return df.iloc[0].to_dict() if not df.empty else None
+    recs = insert_ptms_bulk([ptm])
+    return recs[0] if recs else None
 
 def update_ptm(current: str, new: str):
     sql = '''
@@ -86,8 +253,12 @@ def update_ptm(current: str, new: str):
         RETURNING ptm AS ptm
     '''
     with engine.begin() as conn:
-        df = pd.read_sql(text(sql), conn, params={"c": current, "n": new})
-    return df.iloc[0].to_dict() if not df.empty else None
+        row = conn.execute(text(sql), {"c": current, "n": new}).mappings().first()
+    if row is None:
+        return None
+    _invalidate_reads()
+    st.session_state['inputs_changed'] = True
+    return dict(row)
     
 def delete_ptm(mid: str):
     sql = '''
@@ -96,18 +267,19 @@ def delete_ptm(mid: str):
         RETURNING ptm AS ptm
     '''
     with engine.begin() as conn:
-        df = pd.read_sql(text(sql), conn, params={"mid": str(mid)})
-    return df.iloc[0].to_dict() if not df.empty else None
-    
+        row = conn.execute(text(sql), {"mid": str(mid)}).mappings().first()
+    if row is None:
+        return None
+    _invalidate_reads()
+    st.session_state['inputs_changed'] = True
+    return dict(row)
+    
+def insert_drugs_bulk(names: list[str]):
+    return _insert_names_bulk('drugs', 'drug', names)
+
 def insert_drug(drug: str):
-    sql = '''
-        INSERT INTO drugs(drug)
-        VALUES (:n)
-        RETURNING drug AS drug
-    '''
-    with engine.begin() as conn:
-        df = pd.read_sql(text(sql), conn, params={"n": drug})
-    return df.iloc[0].to_dict() if not df.empty else None
+    recs = insert_drugs_bulk([drug])
+    return recs[0] if recs else None
 
 def update_drug(current: str, new: str):
     sql = '''
@@ -117,8 +289,12 @@ def update_drug(current: str, new: str):
         RETURNING drug AS drug
     '''
     with engine.begin() as conn:
-        df = pd.read_sql(text(sql), conn, params={"c": current, "n": new})
-    return df.iloc[0].to_dict() if not df.empty else None
+        row = conn.execute(text(sql), {"c": current, "n": new}).mappings().first()
+    if row is None:
+        return None
+    _invalidate_reads()
+    st.session_state['inputs_changed'] = True
+    return dict(row)
     
 def delete_drug(mid: str):
     sql = '''
@@ -127,19 +303,46 @@ def delete_drug(mid: str):
         RETURNING drug AS drug
     '''
     with engine.begin() as conn:
-        df = pd.read_sql(text(sql), conn, params={"mid": str(mid)})
-    return df.iloc[0].to_dict() if not df.empty else None
+        row = conn.execute(text(sql), {"mid": str(mid)}).mappings().first()
+    if row is None:
+        return None
+    _invalidate_reads()
+    st.session_state['inputs_changed'] = True
+    return dict(row)
 
-def update_spearman(row: int, val: float):
-    sql = '''
-        UPDATE ptm_correlation_matrix
-        SET spearman_score = :v
-        WHERE id = :r
-        RETURNING spearman_score AS spearman_score
-    '''
+@st.cache_resource
+def ensure_correlation_view():
+    # One-time DDL: the matrix lives in postgres as a materialized view, so
+    # rendering tab3 is just a SELECT. The unique index is what lets
+    # REFRESH ... CONCURRENTLY work without locking readers out.
     with engine.begin() as conn:
-        df = pd.read_sql(text(sql), conn, params={"r": row, "v": val})
-    return df.iloc[0].to_dict() if not df.empty else None
+        # Clear out a leftover plain table from before the matview migration;
+        # IF EXISTS wouldn't help here since DROP TABLE on a matview errors
+        relkind = conn.execute(text(
+            "SELECT relkind FROM pg_class WHERE oid = to_regclass('ptm_correlation_matrix')"
+        )).scalar()
+        if relkind == 'r':
+            conn.execute(text("DROP TABLE ptm_correlation_matrix"))
+        conn.execute(text('''
+            CREATE MATERIALIZED VIEW IF NOT EXISTS ptm_correlation_matrix AS
+            SELECT a.ptm AS ptm1, b.ptm AS ptm2,
+                   -- real is plenty for a [0,1] score shown to a few decimals,
+                   -- and halves both storage and bytes on the wire
+                   (LEAST(a.s, b.s) / GREATEST(a.s, b.s))::real AS spearman_score
+            FROM (SELECT ptm, SUM(reaction_score) AS s FROM ptmdataset GROUP BY ptm) a
+            CROSS JOIN (SELECT ptm, SUM(reaction_score) AS s FROM ptmdataset GROUP BY ptm) b
+        '''))
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS ptm_correlation_matrix_pk "
+            "ON ptm_correlation_matrix(ptm1, ptm2)"
+        ))
+
+def refresh_correlation_matrix():
+    # REFRESH ... CONCURRENTLY is forbidden inside a transaction block,
+    # so this has to run on an autocommit connection
+    with engine.execution_options(isolation_level="AUTOCOMMIT").connect() as conn:
+        conn.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY ptm_correlation_matrix"))
+    _invalidate_reads()
     
 # --------------- UI ---------------
 st.title("🌱 PTMsToPathways DB Viewer")
@@ -148,13 +351,36 @@ st.caption("Neon-ready: SSL on, statement_timeout set after connect, and fast-fa
 with st.sidebar:
     row_limit = st.number_input("Row limit", min_value=1, max_value=2000, value=200, step=50)
 
+# Decide up front whether the derived tables must be regenerated; on plain
+# reruns every read below comes straight out of the caches
+present = fetch_df(
+    "SELECT to_regclass('ptmdataset') IS NOT NULL "
+    "AND to_regclass('ptm_correlation_matrix') IS NOT NULL "
+    "AND to_regclass('common_clusters') IS NOT NULL AS present"
+)
+needs_rebuild = (st.session_state.pop('inputs_changed', False)
+                 or present.empty or not bool(present.iloc[0, 0]))
+
 tab1, tab2, tab3, tab4 = st.tabs(["➕ Input", "📓 Dataset", "↔️ Correlation Matrix", "👜 Clusters"])
 with tab1:
     
     # Display ptms
     st.subheader("Input data")
-    sql = "SELECT ptm FROM ptms ORDER BY ptm"
-    st.dataframe(fetch_df(sql, {"lim": int(row_limit)}), use_container_width=True)
+    # Both display reads go out together instead of back to back; only the
+    # display tables are capped by row_limit, the pickers still need everything
+    ptms_display, drugs_display, names = fetch_many([
+        ("SELECT ptm FROM ptms ORDER BY ptm LIMIT :lim", {"lim": int(row_limit)}),
+        ("SELECT drug FROM drugs ORDER BY drug LIMIT :lim", {"lim": int(row_limit)}),
+        ("SELECT 'ptm' AS kind, ptm AS val FROM ptms UNION SELECT 'drug', drug FROM drugs", None),
+    ])
+    # Both picker frames come out of the single UNION read above
+    if names.empty:
+        ptms = pd.DataFrame(columns=['ptm'])
+        drugs = pd.DataFrame(columns=['drug'])
+    else:
+        ptms = names.loc[names['kind'] == 'ptm', ['val']].rename(columns={'val': 'ptm'})
+        drugs = names.loc[names['kind'] == 'drug', ['val']].rename(columns={'val': 'drug'})
+    st.dataframe(ptms_display, use_container_width=True)
     
     # Insert a ptm
     st.markdown("### ➕ Insert PTM")
@@ -171,24 +397,22 @@ with tab1:
                     st.session_state.just_inserted = rec
                     st.rerun()
     
-    ptms = fetch_df('SELECT ptm FROM ptms')
-           
     # Update a ptm
     st.markdown("### ✏️ Update")
     if ptms.empty:
         st.caption("Nothing to update.")
     else:
-        ptm_choices = {str(r.ptm): f"{str(r.ptm)}" for _, r in ptms.iterrows()}
+        ptm_choices = make_choices(ptms, 'ptm')
         sel_id = st.selectbox("ptm", options=list(ptm_choices.keys()), format_func=lambda k: ptm_choices[k], key="upd_sel")
-        current = ptms[ptms["ptm"] == sel_id].iloc[0]
+        # sel_id *is* the key, so no need to re-filter the frame for the row
 
         with st.form("update_form", clear_on_submit=False):
             c1, c2 = st.columns(2)
             with c1:
-                new_name = st.text_input("ptm", current["ptm"])
-                
+                new_name = st.text_input("ptm", sel_id)
+
             if st.form_submit_button("Update"):
-                rec = update_ptm(str(current["ptm"]), str(new_name))
+                rec = update_ptm(str(sel_id), str(new_name))
                 if rec:
                     st.session_state.just_updated = rec
                     st.rerun()
@@ -198,7 +422,7 @@ with tab1:
     if ptms.empty:
         st.caption("Nothing to delete.")
     else:
-        ptm_choices = {str(r.ptm): f"{str(r.ptm)}" for _, r in ptms.iterrows()}
+        ptm_choices = make_choices(ptms, 'ptm')
         colA, colB = st.columns([3, 2])
         with colA:
             del_id = st.selectbox("Select ptm", options=list(ptm_choices.keys()),
@@ -218,8 +442,7 @@ with tab1:
 
     
     # Display drugs
-    sql2 = "SELECT drug FROM drugs ORDER BY drug"
-    st.dataframe(fetch_df(sql2, {"lim": int(row_limit)}), use_container_width=True)
+    st.dataframe(drugs_display, use_container_width=True)
     
     # Insert a drug
     st.markdown("### ➕ Insert DRUG")
@@ -236,24 +459,21 @@ with tab1:
                     st.session_state.just_inserted = rec
                     st.rerun()
     
-    drugs = fetch_df('SELECT drug FROM drugs')
-    
-    # Update a ptm
+    # Update a drug
     st.markdown("### ✏️ Update")
     if drugs.empty:
         st.caption("Nothing to update.")
     else:
-        drug_choices = {str(r.drug): f"{str(r.drug)}" for _, r in drugs.iterrows()}
+        drug_choices = make_choices(drugs, 'drug')
         sel_id = st.selectbox("drug", options=list(drug_choices.keys()), format_func=lambda k: drug_choices[k], key="upd_sel2")
-        current = drugs[drugs["drug"] == sel_id].iloc[0]
 
         with st.form("update_form2", clear_on_submit=False):
             c1, c2 = st.columns(2)
             with c1:
-                new_name = st.text_input("drug", current["drug"])
-                
+                new_name = st.text_input("drug", sel_id)
+
             if st.form_submit_button("Update"):
-                rec = update_drug(str(current["drug"]), str(new_name))
+                rec = update_drug(str(sel_id), str(new_name))
                 if rec:
                     st.session_state.just_updated = rec
                     st.rerun()
@@ -263,7 +483,7 @@ with tab1:
     if drugs.empty:
         st.caption("Nothing to delete.")
     else:
-        drug_choices = {str(r.drug): f"{str(r.drug)})" for _, r in drugs.iterrows()}
+        drug_choices = make_choices(drugs, 'drug')
         colA, colB = st.columns([3, 2])
         with colA:
             del_id = st.selectbox("Select drug", options=list(drug_choices.keys()),
@@ -283,96 +503,81 @@ with tab1:
     
 with tab2:
     st.subheader("ptmdataset")
-    
-    # Fetch ptms and drugs
-    ptms = fetch_df('SELECT DISTINCT ptm FROM ptms;') # I love sql used like this
-    drugs = fetch_df('SELECT DISTINCT drug FROM drugs;')
-    
-    ptms['key'] = 0 # Required for the cross join 
-    drugs['key'] = 0
-    ptmdataset = pd.merge(ptms, drugs, on='key') # Perform a cross join
-    
-    # Randomize the reaction score between every ptm and drug pair
-    reaction_score = list()
-    for r in range(0, len(ptmdataset)):
-        reaction_score.append(random.uniform(0,10))
-    
-    ptmdataset['reaction_score'] = reaction_score
-    
-    # THE BEST LINE OF CODE EVER WRITTEN - just transforms the data frame into psql database
-    with engine.connect() as conn:
-       ptmdataset.to_sql('ptmdataset', conn, if_exists='replace')
-    
-    
-    sql = '''SELECT ptm, drug, reaction_score FROM ptmdataset;'''
-    st.dataframe(fetch_df(sql, {"lim": int(row_limit)}), use_container_width=True)
+
+    # A plain rerun reads the stored table through the cache; only an actual
+    # input change (or a missing table) pays for the rebuild
+    if needs_rebuild:
+        # tab1 already split the picker UNION into ptms/drugs this run, and
+        # those frames are still in scope - no second round-trip needed
+
+        # Cross join every ptm with every drug and draw all the random reaction
+        # scores in one shot, instead of a sentinel-key merge plus a per-row loop
+        idx = pd.MultiIndex.from_product([ptms['ptm'].to_numpy(), drugs['drug'].to_numpy()],
+                                         names=['ptm', 'drug'])
+        ptmdataset = idx.to_frame(index=False)
+        ptmdataset['reaction_score'] = np.random.default_rng().uniform(0, 10, size=len(idx))
+
+        # THE BEST LINE OF CODE EVER WRITTEN - just transforms the data frame into psql database
+        bulk_replace(ptmdataset, 'ptmdataset', ['ptm', 'drug', 'reaction_score'])
+
+    st.dataframe(fetch_df('SELECT ptm, drug, reaction_score FROM ptmdataset '
+                          'ORDER BY ptm, drug LIMIT :lim', {"lim": int(row_limit)}),
+                 use_container_width=True)
     
 with tab3:
     st.subheader("correlation matrix")
     
-    PTMdataset = fetch_df('''SELECT DISTINCT ptm FROM PTMdataset''')
-    reaction_score = fetch_df("SELECT ptm, SUM(reaction_score) FROM PTMdataset GROUP BY ptm") # Holds reaction scores
-    
-    ptm1 = list()
-    ptm2 = list()
-    spearman_score = list()
-    
-    for i in range(0, len(reaction_score)): # For loop for creating the spearman score values
-        for j in range(0, len(reaction_score)):
-            p1 = reaction_score.iloc[i, 0]
-            p2 = reaction_score.iloc[j, 0]
-            
-            s1 = float(reaction_score.iloc[i, 1])
-            s2 = float(reaction_score.iloc[j, 1])
-            
-            ptm1.append(p1)
-            ptm2.append(p2)
-            spearman_score.append(min(s1, s2) / max(s1, s2))
-    
-    data = {'ptm1':ptm1, 'ptm2':ptm2,'spearman_score':spearman_score} # Add them all to a new data frame
-    ptm_correlation_matrix = pd.DataFrame(data) 
-    
-    # The best line of code ever written: Basically overwrites the database on the psql server
-    with engine.connect() as conn:
-       ptm_correlation_matrix.to_sql('ptm_correlation_matrix', conn, if_exists='replace') 
-       
-    sql = '''SELECT ptm1, ptm2, spearman_score FROM ptm_correlation_matrix;'''
-    st.dataframe(fetch_df(sql, {"lim": int(row_limit)}), use_container_width=True)
+    # The matrix is a materialized view over ptmdataset; refresh it only when
+    # the dataset was actually rebuilt this run, otherwise just read it
+    ensure_correlation_view()
+    if needs_rebuild:
+        refresh_correlation_matrix()
+        matrix_df = fetch_df('SELECT ptm1, ptm2, spearman_score FROM ptm_correlation_matrix')
+
+    # Show only the first streamed batch, capped at the sidebar row limit;
+    # the full frame is still around for tab4
+    st.dataframe(next(stream_df('SELECT ptm1, ptm2, spearman_score FROM ptm_correlation_matrix '
+                                f'ORDER BY ptm1, ptm2 LIMIT {int(row_limit)}'), pd.DataFrame()),
+                 use_container_width=True)
 
 with tab4:
     st.subheader("Common Clusters") 
     
-    pdata = fetch_df('''SELECT ptm1, ptm2, spearman_score FROM ptm_correlation_matrix''') # fetch the data
-    
-    clusters = list() # initilize an empty list of clusters
-    
-    for i in range(0, len(pdata)):
-        s1 = pdata.iloc[i, 2]
-        temp = list() # Create a temporary list holding the ptm we are currently looking at
-        
-        for j in range(0, len(pdata)):
-            s2 = pdata.iloc[j, 2] 
-            
-            if abs(s1 - s2) < 0.5: # if the difference between the two scores is less than 0.5, then they cluster together, this will automatically add ptm i 
-                temp.append(pdata.iloc[j,1])
-        
-        # eliminate non-unique values from temp 
-        temp = list(set(temp))
-        if len(temp) > 1:
-            clusters.append(', '.join(temp))
-    
-    #eliminate non-unique values from common clusters
-    clusters = list(set(clusters))
-    data = {'clusters':clusters} # Add them all to a new dictonary
-    common_clusters = pd.DataFrame(data) 
-    
-    with engine.connect() as conn:
-       common_clusters.to_sql('common_clusters', conn, if_exists='replace') 
-    
-    sql = '''SELECT clusters FROM common_clusters;'''
-    st.dataframe(fetch_df(sql, {"lim": int(row_limit)}), use_container_width=True)
-    
-    if common_clusters.empty:
+    # Clusters derive only from the matrix, so recompute them only when it
+    # actually changed this run; otherwise the rebuild (and the cache clear
+    # at the end of bulk_replace) would wipe the read cache on every rerun
+    if needs_rebuild:
+        pdata = matrix_df  # same frame tab3 just refreshed; no extra fetch
+
+        clusters = list() # initilize an empty list of clusters
+
+        for i in range(0, len(pdata)):
+            s1 = pdata.iloc[i, 2]
+            temp = list() # Create a temporary list holding the ptm we are currently looking at
+
+            for j in range(0, len(pdata)):
+                s2 = pdata.iloc[j, 2]
+
+                if abs(s1 - s2) < 0.5: # if the difference between the two scores is less than 0.5, then they cluster together, this will automatically add ptm i
+                    temp.append(pdata.iloc[j,1])
+
+            # eliminate non-unique values from temp
+            temp = list(set(temp))
+            if len(temp) > 1:
+                clusters.append(', '.join(temp))
+
+        #eliminate non-unique values from common clusters
+        clusters = list(set(clusters))
+        data = {'clusters':clusters} # Add them all to a new dictonary
+        common_clusters = pd.DataFrame(data)
+
+        bulk_replace(common_clusters, 'common_clusters', ['clusters'])
+
+    sql = '''SELECT clusters FROM common_clusters ORDER BY clusters LIMIT :lim'''
+    clusters_df = fetch_df(sql, {"lim": int(row_limit)})
+    st.dataframe(clusters_df, use_container_width=True)
+
+    if clusters_df.empty:
         st.markdown("No Clusters found. Try rerunning?")
     
     